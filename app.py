@@ -1,7 +1,6 @@
-from flask import Flask, request
+from flask import Flask, request, url_for
 from twilio.twiml.messaging_response import MessagingResponse
 from twilio.rest import Client
-from datetime import datetime
 import sqlite3
 import re
 import os
@@ -11,11 +10,14 @@ from twilio.request_validator import RequestValidator
 from typing import Dict
 import time
 from db import init_db
+from outbox import enqueue_message, status_buffer
+from wallet import adjust_balance
 from config import TWILIO_ACCOUNT_SID ,TWILIO_AUTH_TOKEN,TWILIO_PHONE_NUMBER,DEBUG 
 from states import  UserState,IDTypes,VerificationMethods
 from twilio_utils import validate_twilio_request
 from session import session_manager
-from utils import format_main_menu, format_wallet_menu,format_zim_services_menu,format_eft_menu,format_voucher_menu,format_buy_voucher_menu
+from utils import format_main_menu, format_wallet_menu,format_zim_services_menu,format_eft_menu,format_voucher_menu,format_buy_voucher_menu,format_ecocash_confirm,format_balance,format_history,format_deposit_success
+from commands import Command, parse_command, parse_amount, validate_deposit_phone
 
 # Load environment variables
 load_dotenv()
@@ -52,6 +54,33 @@ def get_user(phone_number):
         return dict(zip(columns, result)) if result else None
 
 
+def get_recent_transactions(phone_number, limit=5):
+    with sqlite3.connect("users.db") as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT * FROM transactions WHERE phone_number = ? ORDER BY id DESC LIMIT ?",
+            (phone_number, limit),
+        )
+        columns = [description[0] for description in c.description]
+        return [dict(zip(columns, row)) for row in c.fetchall()]
+
+
+def send_reply(resp, msg, sender, outbox_id=None):
+    """Record the reply in the outbox (unless the caller already did so in
+    its own transaction) and ask Twilio to report its delivery status."""
+    if outbox_id is None:
+        body = "\n\n".join(verb.value for verb in msg.verbs if verb.value)
+        if not body:
+            return str(resp)
+        with sqlite3.connect("users.db") as conn:
+            outbox_id = enqueue_message(conn, sender, body)
+            conn.commit()
+
+    msg.attrs["action"] = url_for("status_callback", outbox_id=outbox_id, _external=True)
+    msg.attrs["method"] = "POST"
+    return str(resp)
+
+
 @app.errorhandler(Exception)
 def handle_error(error):
     print(f"Error: {str(error)}")
@@ -101,6 +130,28 @@ def handle_menu_command(incoming_msg, user, sender):
 
         return True, "Cannot go back from here. Type 'menu' to return to main menu."
 
+    return handle_shortcut_command(incoming_msg, user, sender)
+
+
+def handle_shortcut_command(incoming_msg, user, sender):
+    command, args = parse_command(incoming_msg)
+
+    if command == Command.BALANCE:
+        return True, format_balance(user["wallet_balance"])
+
+    elif command == Command.HISTORY:
+        return True, format_history(get_recent_transactions(sender))
+
+    elif command == Command.DEPOSIT:
+        # Jump straight to the confirmation step of the EcoCash flow
+        update_user_data(sender, "ecocash_phone", args["phone"])
+        update_user_data(sender, "ecocash_amount", args["amount"])
+        update_user_state(sender, UserState.ECOCASH_CONFIRM)
+        return True, format_ecocash_confirm(args["phone"], args["amount"])
+
+    elif command == Command.INVALID:
+        return True, args["error"]
+
     return False, None
 
 
@@ -114,32 +165,34 @@ def webhook():
     msg = resp.message()
 
     user = get_user(sender)
+    # Set when the reply is written to the outbox in the same transaction as a state change
+    outbox_id = None
 
     if user and user["registration_complete"]:
         is_menu, menu_text = handle_menu_command(incoming_msg, user, sender)
         if is_menu:
             msg.body(menu_text)
-            return str(resp)
+            return send_reply(resp, msg, sender)
 
     if not user and incoming_msg.lower() == "hi":
+        reply = """Welcome to TISUWAY Wallet! 🌟
+        
+Let's get you registered. Please enter your First Name and Last Name.
+
+(Type 'menu' anytime to return to main menu after registration)
+(Type 'back' to go back one step in the menu)"""
         with sqlite3.connect("users.db") as conn:
             c = conn.cursor()
             c.execute(
                 "INSERT INTO users (phone_number, current_state, registration_complete) VALUES (?, ?, ?)",
                 (sender, UserState.WELCOME, False),
             )
+            outbox_id = enqueue_message(conn, sender, reply)
             conn.commit()
 
-        msg.body(
-            """Welcome to TISUWAY Wallet! 🌟
-        
-Let's get you registered. Please enter your First Name and Last Name.
-
-(Type 'menu' anytime to return to main menu after registration)
-(Type 'back' to go back one step in the menu)"""
-        )
+        msg.body(reply)
         update_user_state(sender, UserState.FIRST_NAME)
-        return str(resp)
+        return send_reply(resp, msg, sender, outbox_id)
 
     if user:
         current_state = get_user_state(sender)
@@ -147,14 +200,16 @@ Let's get you registered. Please enter your First Name and Last Name.
         if current_state == UserState.FIRST_NAME:
             names = incoming_msg.split()
             if len(names) >= 2:
+                reply = "Please enter your Surname"
                 with sqlite3.connect("users.db") as conn:
                     c = conn.cursor()
                     c.execute(
                         "UPDATE users SET first_name = ?, last_name = ?, current_state = ? WHERE phone_number = ?",
                         (names[0], names[1], UserState.SURNAME, sender),
                     )
+                    outbox_id = enqueue_message(conn, sender, reply)
                     conn.commit()
-                msg.body("Please enter your Surname")
+                msg.body(reply)
                 update_user_state(sender, UserState.SURNAME)
             else:
                 msg.body(
@@ -162,40 +217,45 @@ Let's get you registered. Please enter your First Name and Last Name.
                 )
 
         elif current_state == UserState.SURNAME:
+            reply = "Please enter your Nationality"
             with sqlite3.connect("users.db") as conn:
                 c = conn.cursor()
                 c.execute(
                     "UPDATE users SET surname = ?, current_state = ? WHERE phone_number = ?",
                     (incoming_msg, UserState.NATIONALITY, sender),
                 )
+                outbox_id = enqueue_message(conn, sender, reply)
                 conn.commit()
-            msg.body("Please enter your Nationality")
+            msg.body(reply)
             update_user_state(sender, UserState.NATIONALITY)
 
         elif current_state == UserState.NATIONALITY:
+            reply = "Please enter your Full Residential Address"
             with sqlite3.connect("users.db") as conn:
                 c = conn.cursor()
                 c.execute(
                     "UPDATE users SET nationality = ?, current_state = ? WHERE phone_number = ?",
                     (incoming_msg, UserState.ADDRESS, sender),
                 )
+                outbox_id = enqueue_message(conn, sender, reply)
                 conn.commit()
-            msg.body("Please enter your Full Residential Address")
+            msg.body(reply)
             update_user_state(sender, UserState.ADDRESS)
 
         elif current_state == UserState.ADDRESS:
+            id_options = "\n".join(
+                [f"{i+1}. {opt}" for i, opt in enumerate(IDTypes.OPTIONS)]
+            )
+            reply = f"Select ID Type:\n{id_options}"
             with sqlite3.connect("users.db") as conn:
                 c = conn.cursor()
                 c.execute(
                     "UPDATE users SET address = ?, current_state = ? WHERE phone_number = ?",
                     (incoming_msg, UserState.ID_TYPE, sender),
                 )
+                outbox_id = enqueue_message(conn, sender, reply)
                 conn.commit()
-
-            id_options = "\n".join(
-                [f"{i+1}. {opt}" for i, opt in enumerate(IDTypes.OPTIONS)]
-            )
-            msg.body(f"Select ID Type:\n{id_options}")
+            msg.body(reply)
             update_user_state(sender, UserState.ID_TYPE)
 
         elif current_state == UserState.ID_TYPE:
@@ -203,14 +263,16 @@ Let's get you registered. Please enter your First Name and Last Name.
                 selection = int(incoming_msg)
                 if 1 <= selection <= len(IDTypes.OPTIONS):
                     id_type = IDTypes.OPTIONS[selection - 1]
+                    reply = f"Please enter your {id_type} number"
                     with sqlite3.connect("users.db") as conn:
                         c = conn.cursor()
                         c.execute(
                             "UPDATE users SET id_type = ?, current_state = ? WHERE phone_number = ?",
                             (id_type, UserState.ID_NUMBER, sender),
                         )
+                        outbox_id = enqueue_message(conn, sender, reply)
                         conn.commit()
-                    msg.body(f"Please enter your {id_type} number")
+                    msg.body(reply)
                     update_user_state(sender, UserState.ID_NUMBER)
                 else:
                     msg.body("Invalid selection. Please choose a number from the list.")
@@ -218,18 +280,19 @@ Let's get you registered. Please enter your First Name and Last Name.
                 msg.body("Please enter a valid number")
 
         elif current_state == UserState.ID_NUMBER:
+            verification_options = "\n".join(
+                [f"{i+1}. {opt}" for i, opt in enumerate(VerificationMethods.OPTIONS)]
+            )
+            reply = f"Select Verification Method:\n{verification_options}"
             with sqlite3.connect("users.db") as conn:
                 c = conn.cursor()
                 c.execute(
                     "UPDATE users SET id_number = ?, current_state = ? WHERE phone_number = ?",
                     (incoming_msg, UserState.VERIFICATION, sender),
                 )
+                outbox_id = enqueue_message(conn, sender, reply)
                 conn.commit()
-
-            verification_options = "\n".join(
-                [f"{i+1}. {opt}" for i, opt in enumerate(VerificationMethods.OPTIONS)]
-            )
-            msg.body(f"Select Verification Method:\n{verification_options}")
+            msg.body(reply)
             update_user_state(sender, UserState.VERIFICATION)
 
         elif current_state == UserState.VERIFICATION:
@@ -237,14 +300,16 @@ Let's get you registered. Please enter your First Name and Last Name.
                 selection = int(incoming_msg)
                 if 1 <= selection <= len(VerificationMethods.OPTIONS):
                     verification_method = VerificationMethods.OPTIONS[selection - 1]
+                    reply = "Please create a 4-digit passcode for your wallet"
                     with sqlite3.connect("users.db") as conn:
                         c = conn.cursor()
                         c.execute(
                             "UPDATE users SET verification_method = ?, current_state = ? WHERE phone_number = ?",
                             (verification_method, UserState.PASSCODE, sender),
                         )
+                        outbox_id = enqueue_message(conn, sender, reply)
                         conn.commit()
-                    msg.body("Please create a 4-digit passcode for your wallet")
+                    msg.body(reply)
                     update_user_state(sender, UserState.PASSCODE)
                 else:
                     msg.body("Invalid selection. Please choose a number from the list.")
@@ -253,22 +318,27 @@ Let's get you registered. Please enter your First Name and Last Name.
 
         elif current_state == UserState.PASSCODE:
             if re.match(r"^\d{4}$", incoming_msg):
+                reply = f"""Registration Complete! 🎉
+
+Navigation commands:
+- Type 'menu' anytime to return to the main menu
+- Type 'back' to go back one step in the menu
+
+Shortcuts:
+- 'bal' to check your balance
+- 'hist' to view recent transactions
+- 'dep ecocash 077xxxxxxx <amount>' to deposit
+
+{format_main_menu()}"""
                 with sqlite3.connect("users.db") as conn:
                     c = conn.cursor()
                     c.execute(
                         "UPDATE users SET passcode = ?, current_state = ?, registration_complete = ? WHERE phone_number = ?",
                         (incoming_msg, UserState.MAIN_MENU, True, sender),
                     )
+                    outbox_id = enqueue_message(conn, sender, reply)
                     conn.commit()
-                msg.body(
-                    f"""Registration Complete! 🎉
-
-Navigation commands:
-- Type 'menu' anytime to return to the main menu
-- Type 'back' to go back one step in the menu
-
-{format_main_menu()}"""
-                )
+                msg.body(reply)
                 update_user_state(sender, UserState.MAIN_MENU)
             else:
                 msg.body("Please enter a valid 4-digit passcode")
@@ -377,7 +447,8 @@ Type 'menu' for Main Menu"""
                 msg.body(format_eft_menu())
 
         elif current_state == UserState.ECOCASH_PHONE:
-            if re.match(r"^077\d{7}$", incoming_msg):
+            error = validate_deposit_phone("ecocash", incoming_msg)
+            if not error:
                 update_user_data(sender, "ecocash_phone", incoming_msg)
                 msg.body(
                     """Enter the amount you want to deposit:
@@ -386,58 +457,36 @@ Type 'menu' for Main Menu"""
                 )
                 update_user_state(sender, UserState.ECOCASH_AMOUNT)
             else:
-                msg.body(
-                    "Please enter a valid EcoCash phone number in the format: 077xxxxxxx"
-                )
+                msg.body(error)
 
         elif current_state == UserState.ECOCASH_AMOUNT:
-            try:
-                amount = float(incoming_msg)
-                if amount > 0:
-                    update_user_data(sender, "ecocash_amount", amount)
-                    ecocash_phone = get_user_data(sender, "ecocash_phone")
-                    msg.body(
-                        f"""Confirm your deposit:
-- Phone: {ecocash_phone}
-- Amount: ${amount:.2f}
-
-Reply 'yes' to confirm or 'no' to cancel.
-Type 'back' to return to amount input
-Type 'menu' for Main Menu"""
-                    )
-                    update_user_state(sender, UserState.ECOCASH_CONFIRM)
-                else:
-                    msg.body("Please enter a valid amount greater than 0")
-            except ValueError:
-                msg.body("Please enter a valid amount")
+            amount, error = parse_amount(incoming_msg)
+            if not error:
+                update_user_data(sender, "ecocash_amount", amount)
+                ecocash_phone = get_user_data(sender, "ecocash_phone")
+                msg.body(format_ecocash_confirm(ecocash_phone, amount))
+                update_user_state(sender, UserState.ECOCASH_CONFIRM)
+            else:
+                msg.body(error)
 
         elif current_state == UserState.ECOCASH_CONFIRM:
             if incoming_msg.lower() == "yes":
                 ecocash_phone = get_user_data(sender, "ecocash_phone")
                 amount = get_user_data(sender, "ecocash_amount")
-                # Process deposit transaction here
-                with sqlite3.connect("users.db") as conn:
-                    c = conn.cursor()
-                    c.execute(
-                        "UPDATE users SET wallet_balance = wallet_balance + ? WHERE phone_number = ?",
-                        (amount, sender),
-                    )
-                    c.execute(
-                        "INSERT INTO transactions (phone_number, transaction_type, amount, timestamp, description) VALUES (?, ?, ?, ?, ?)",
-                        (
-                            sender,
-                            "Deposit",
-                            amount,
-                            datetime.now(),
-                            f"EcoCash deposit from {ecocash_phone}",
-                        ),
-                    )
-                    conn.commit()
+                # The reply is written to the outbox in the same transaction
+                # as the balance change, using the post-update balance
+                balance, outbox_id = adjust_balance(
+                    sender,
+                    amount,
+                    "Deposit",
+                    f"EcoCash deposit from {ecocash_phone}",
+                    after=lambda conn, balance: enqueue_message(
+                        conn, sender, format_deposit_success(balance)
+                    ),
+                )
 
-                msg.body(f"Deposit successful! Your new balance is: ${amount:.2f}")
+                msg.body(format_deposit_success(balance))
                 update_user_state(sender, UserState.WALLET_MENU)
-                user = get_user(sender)
-                msg.body(format_wallet_menu(user["wallet_balance"]))
             elif incoming_msg.lower() == "no":
                 msg.body("Deposit canceled. Returning to payment methods.")
                 update_user_state(sender, UserState.EFT_MENU)
@@ -445,7 +494,21 @@ Type 'menu' for Main Menu"""
             else:
                 msg.body("Please reply with 'yes' to confirm or 'no' to cancel.")
 
-    return str(resp)
+    return send_reply(resp, msg, sender, outbox_id)
+
+
+@app.route("/status", methods=["POST"])
+@validate_twilio_request
+def status_callback():
+    outbox_id = request.args.get("outbox_id", type=int)
+    if outbox_id is not None:
+        status_buffer.add(
+            outbox_id,
+            request.values.get("MessageSid"),
+            request.values.get("MessageStatus", ""),
+            request.values.get("ErrorCode"),
+        )
+    return "", 204
 
 
 if __name__ == "__main__":
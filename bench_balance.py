@@ -0,0 +1,115 @@
+"""Multi-threaded stress benchmark for wallet balance updates.
+
+Runs concurrent deposits and transfers against a scratch database, then
+checks that no money was created or lost and reports ops/sec.
+
+    python bench_balance.py --threads 8 --ops 500
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from db import init_db
+from wallet import BalanceError, adjust_balance, transfer_balance
+
+INITIAL_BALANCE = 1000
+
+
+def setup_users(db_path, count):
+    users = [f"whatsapp:+26377{i:07d}" for i in range(count)]
+    with sqlite3.connect(db_path) as conn:
+        c = conn.cursor()
+        c.executemany(
+            "INSERT INTO users (phone_number, registration_complete, wallet_balance) VALUES (?, ?, ?)",
+            [(user, True, INITIAL_BALANCE) for user in users],
+        )
+        conn.commit()
+    return users
+
+
+def worker(db_path, users, ops, stats, lock):
+    rng = random.Random()
+    done = deposited = rejected = errors = 0
+    for _ in range(ops):
+        amount = rng.randint(1, 50)
+        try:
+            if rng.random() < 0.5:
+                adjust_balance(rng.choice(users), amount, "Deposit", "bench", db_path=db_path)
+                deposited += amount
+            else:
+                sender, recipient = rng.sample(users, 2)
+                transfer_balance(sender, recipient, amount, "bench", db_path=db_path)
+            done += 1
+        except BalanceError:
+            rejected += 1
+        except sqlite3.OperationalError:
+            errors += 1
+
+    with lock:
+        stats["ops"] += done
+        stats["deposited"] += deposited
+        stats["rejected"] += rejected
+        stats["errors"] += errors
+
+
+def check_integrity(db_path, users, deposited):
+    with sqlite3.connect(db_path) as conn:
+        c = conn.cursor()
+        c.execute("SELECT SUM(wallet_balance) FROM users")
+        total = c.fetchone()[0]
+        c.execute(
+            "SELECT u.phone_number FROM users u LEFT JOIN transactions t ON t.phone_number = u.phone_number "
+            "GROUP BY u.phone_number HAVING u.wallet_balance != ? + COALESCE(SUM(t.amount), 0)",
+            (INITIAL_BALANCE,),
+        )
+        mismatched = [row[0] for row in c.fetchall()]
+
+    expected = INITIAL_BALANCE * len(users) + deposited
+    return total == expected, total, expected, mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=500, help="operations per thread")
+    parser.add_argument("--users", type=int, default=10)
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error("--users must be at least 2 to run transfers")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        init_db(db_path)
+        users = setup_users(db_path, args.users)
+
+        stats = {"ops": 0, "deposited": 0, "rejected": 0, "errors": 0}
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=worker, args=(db_path, users, args.ops, stats, lock))
+            for _ in range(args.threads)
+        ]
+
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        ok, total, expected, mismatched = check_integrity(db_path, users, stats["deposited"])
+
+    print(f"Threads: {args.threads}, ops/thread: {args.ops}, users: {args.users}")
+    print(f"Committed: {stats['ops']} in {elapsed:.2f}s ({stats['ops'] / elapsed:.0f} ops/sec)")
+    print(f"Rejected (insufficient funds): {stats['rejected']}")
+    print(f"Lock errors after retries: {stats['errors']}")
+    print(f"Total balance: {total} (expected {expected})")
+    print(f"Integrity: {'OK' if ok and not mismatched else 'FAILED'}")
+    if mismatched:
+        print(f"Balances not matching transaction history: {', '.join(mismatched)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import math
+import re
+
+# One-shot shortcut commands, e.g. "bal", "hist", "dep ecocash 0771234567 20"
+BALANCE_COMMANDS = ["bal", "balance"]
+HISTORY_COMMANDS = ["hist", "history"]
+DEPOSIT_COMMANDS = ["dep", "deposit"]
+
+DEPOSIT_METHODS = {
+    "ecocash": r"^077\d{7}$",
+}
+
+
+def validate_deposit_phone(method, phone):
+    """Return an error message if phone is not valid for the deposit method,
+    or None. Shared by the shortcut parser and the menu state machine."""
+    if not re.match(DEPOSIT_METHODS[method], phone):
+        return "Please enter a valid EcoCash phone number in the format: 077xxxxxxx"
+    return None
+
+
+def parse_amount(text):
+    """Parse a deposit amount into (amount, None), or (None, error)."""
+    try:
+        amount = float(text)
+    except ValueError:
+        return None, "Please enter a valid amount"
+    if not math.isfinite(amount) or amount <= 0:
+        return None, "Please enter a valid amount greater than 0"
+    return amount, None
+
+
+class Command:
+    BALANCE = "balance"
+    HISTORY = "history"
+    DEPOSIT = "deposit"
+    INVALID = "invalid"
+
+
+def parse_command(incoming_msg):
+    """Parse a shortcut command into (command, args), or (None, None) if the
+    message is not a shortcut and should go to the menu state machine."""
+    parts = incoming_msg.lower().split()
+    if not parts:
+        return None, None
+
+    keyword = parts[0]
+
+    if keyword in BALANCE_COMMANDS and len(parts) == 1:
+        return Command.BALANCE, {}
+
+    if keyword in HISTORY_COMMANDS and len(parts) == 1:
+        return Command.HISTORY, {}
+
+    if keyword in DEPOSIT_COMMANDS:
+        if len(parts) != 4:
+            return Command.INVALID, {
+                "error": "Usage: dep ecocash 077xxxxxxx <amount>"
+            }
+
+        method, phone, amount = parts[1], parts[2], parts[3]
+        if method not in DEPOSIT_METHODS:
+            methods = ", ".join(DEPOSIT_METHODS)
+            return Command.INVALID, {
+                "error": f"Unsupported deposit method. Available: {methods}"
+            }
+        error = validate_deposit_phone(method, phone)
+        if error:
+            return Command.INVALID, {"error": error}
+
+        amount, error = parse_amount(amount)
+        if error:
+            return Command.INVALID, {"error": error}
+
+        return Command.DEPOSIT, {"method": method, "phone": phone, "amount": amount}
+
+    return None, None
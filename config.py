@@ -12,5 +12,13 @@ TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 # Database Configuration
 DATABASE_PATH = os.getenv("DATABASE_PATH", "users.db")
 
+# Outbox status callbacks are buffered and written in batches
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "2.0"))
+
+# Balance updates: seconds to wait for the write lock, and retries after that
+BALANCE_BUSY_TIMEOUT = float(os.getenv("BALANCE_BUSY_TIMEOUT", "1.0"))
+BALANCE_MAX_RETRIES = int(os.getenv("BALANCE_MAX_RETRIES", "5"))
+
 # Debug
 DEBUG = os.getenv("DEBUG")
\ No newline at end of file
@@ -1,9 +1,11 @@
 import sqlite3
 
 # Database initialization
-def init_db():
-    with sqlite3.connect("users.db") as conn:
+def init_db(db_path="users.db"):
+    with sqlite3.connect(db_path) as conn:
         c = conn.cursor()
+        # WAL lets readers (e.g. get_user) proceed while a balance update holds the write lock
+        c.execute("PRAGMA journal_mode=WAL")
         c.execute(
             """CREATE TABLE IF NOT EXISTS users
                      (phone_number TEXT PRIMARY KEY, 
@@ -30,4 +32,20 @@ def init_db():
                       timestamp DATETIME,
                       description TEXT)"""
         )
+
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS outbox
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      phone_number TEXT,
+                      body TEXT,
+                      message_sid TEXT,
+                      status TEXT DEFAULT 'pending',
+                      status_rank INTEGER DEFAULT 0,
+                      error_code TEXT,
+                      created_at DATETIME,
+                      updated_at DATETIME)"""
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, created_at)"
+        )
         conn.commit()
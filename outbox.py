@@ -0,0 +1,128 @@
+import atexit
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from config import OUTBOX_BATCH_SIZE, OUTBOX_FLUSH_INTERVAL
+
+# Twilio message statuses, ranked so a late "sent" callback never
+# overwrites an earlier "delivered" one
+STATUS_RANK = {
+    "pending": 0,
+    "accepted": 1,
+    "queued": 2,
+    "sending": 3,
+    "sent": 4,
+    "undelivered": 5,
+    "failed": 5,
+    "delivered": 6,
+    "read": 7,
+}
+
+DELIVERED_STATUSES = ["delivered", "read"]
+
+
+def enqueue_message(conn, phone_number, body):
+    """Record an outgoing reply using the caller's connection, so it is
+    committed in the same transaction as the state change it reports."""
+    now = datetime.now()
+    c = conn.cursor()
+    c.execute(
+        "INSERT INTO outbox (phone_number, body, status, status_rank, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (phone_number, body, "pending", STATUS_RANK["pending"], now, now),
+    )
+    return c.lastrowid
+
+
+def get_undelivered_messages(older_than_seconds=60, db_path="users.db"):
+    """Return outbox messages not confirmed delivered after older_than_seconds."""
+    if status_buffer.db_path == db_path:
+        status_buffer.flush()
+    cutoff = datetime.now() - timedelta(seconds=older_than_seconds)
+    placeholders = ", ".join("?" for _ in DELIVERED_STATUSES)
+    with sqlite3.connect(db_path) as conn:
+        c = conn.cursor()
+        c.execute(
+            f"SELECT * FROM outbox WHERE status NOT IN ({placeholders}) AND created_at <= ? ORDER BY created_at",
+            (*DELIVERED_STATUSES, cutoff),
+        )
+        columns = [description[0] for description in c.description]
+        return [dict(zip(columns, row)) for row in c.fetchall()]
+
+
+class StatusCallbackBuffer:
+    """Buffers Twilio status callbacks in memory and writes them to SQLite
+    in batches instead of committing once per callback."""
+
+    def __init__(self, batch_size=OUTBOX_BATCH_SIZE, flush_interval=OUTBOX_FLUSH_INTERVAL, db_path="users.db"):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.events = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.worker = None
+
+    def add(self, outbox_id, message_sid, status, error_code=None):
+        rank = STATUS_RANK.get(status, 0)
+        with self.lock:
+            # Only the most advanced status per message needs to be written
+            current = self.events.get(outbox_id)
+            if current is None or rank >= current[2]:
+                self.events[outbox_id] = (message_sid, status, rank, error_code)
+            pending = len(self.events)
+            self._start_worker()
+
+        if pending >= self.batch_size:
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                # The batch was re-queued; the background worker retries it
+                print(f"Error flushing status callbacks: {str(e)}")
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.events:
+                    return 0
+                events, self.events = self.events, {}
+
+            now = datetime.now()
+            rows = [
+                (message_sid, status, rank, error_code, now, outbox_id, rank)
+                for outbox_id, (message_sid, status, rank, error_code) in events.items()
+            ]
+            try:
+                with sqlite3.connect(self.db_path) as conn:
+                    c = conn.cursor()
+                    c.executemany(
+                        "UPDATE outbox SET message_sid = ?, status = ?, status_rank = ?, error_code = ?, updated_at = ? WHERE id = ? AND status_rank <= ?",
+                        rows,
+                    )
+                    conn.commit()
+            except sqlite3.Error:
+                # Put the batch back so the next flush retries it
+                with self.lock:
+                    for outbox_id, event in events.items():
+                        current = self.events.get(outbox_id)
+                        if current is None or event[2] > current[2]:
+                            self.events[outbox_id] = event
+                raise
+            return len(rows)
+
+    def _start_worker(self):
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self._run, daemon=True)
+            self.worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Error flushing status callbacks: {str(e)}")
+
+
+status_buffer = StatusCallbackBuffer()
+atexit.register(status_buffer.flush)
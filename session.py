@@ -15,4 +15,7 @@ class UserSession:
     def update_data(self, sender, key, value):
         self.get_session(sender)["data"][key] = value
 
+    def get_data(self, sender, key):
+        return self.get_session(sender)["data"].get(key)
+
 session_manager = UserSession()
@@ -140,3 +140,36 @@ def format_zesa_menu():
 Reply with a number to select an option.
 Type 'back' to return to Zimbabwe Services
 Type 'menu' for Main Menu"""
+
+def format_ecocash_confirm(ecocash_phone, amount):
+    return f"""Confirm your deposit:
+- Phone: {ecocash_phone}
+- Amount: ${amount:.2f}
+
+Reply 'yes' to confirm or 'no' to cancel.
+Type 'back' to return to amount input
+Type 'menu' for Main Menu"""
+
+def format_deposit_success(balance):
+    return f"""Deposit successful! Your new balance is: ${balance:.2f}
+
+{format_wallet_menu(balance)}"""
+
+def format_balance(balance):
+    return f"""Your wallet balance is: ${balance:.2f}
+
+Type 'menu' for Main Menu"""
+
+def format_history(transactions):
+    if not transactions:
+        return """No transactions yet.
+
+Type 'menu' for Main Menu"""
+    lines = "\n".join(
+        f"- {str(t['timestamp'])[:16]} {t['transaction_type']} ${t['amount']:.2f}"
+        for t in transactions
+    )
+    return f"""Recent Transactions:
+{lines}
+
+Type 'menu' for Main Menu"""
@@ -0,0 +1,107 @@
+import math
+import random
+import sqlite3
+import time
+from datetime import datetime
+from config import BALANCE_BUSY_TIMEOUT, BALANCE_MAX_RETRIES
+
+
+class BalanceError(Exception):
+    pass
+
+
+class UserNotFound(BalanceError):
+    pass
+
+
+class InsufficientFunds(BalanceError):
+    pass
+
+
+def _is_locked(error):
+    message = str(error).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def run_immediate(work, db_path="users.db", max_retries=BALANCE_MAX_RETRIES):
+    """Run work(conn) inside a BEGIN IMMEDIATE transaction, retrying with
+    jittered backoff when the write lock cannot be acquired.
+
+    BEGIN IMMEDIATE takes the write lock up front, so two writers can never
+    both read and then fail to upgrade to a write lock mid-transaction.
+    """
+    attempt = 0
+    while True:
+        conn = sqlite3.connect(db_path, timeout=BALANCE_BUSY_TIMEOUT, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(conn)
+                conn.execute("COMMIT")
+                return result
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        except sqlite3.OperationalError as e:
+            if not _is_locked(e) or attempt >= max_retries:
+                raise
+            attempt += 1
+            time.sleep(random.uniform(0, 0.01 * 2**attempt))
+        finally:
+            conn.close()
+
+
+def _apply_change(c, phone_number, amount, transaction_type, description):
+    c.execute(
+        "UPDATE users SET wallet_balance = wallet_balance + ? WHERE phone_number = ? AND wallet_balance + ? >= 0",
+        (amount, phone_number, amount),
+    )
+    if c.rowcount == 0:
+        c.execute("SELECT 1 FROM users WHERE phone_number = ?", (phone_number,))
+        if c.fetchone() is None:
+            raise UserNotFound(f"No wallet for {phone_number}")
+        raise InsufficientFunds(f"Insufficient funds for {phone_number}")
+
+    c.execute(
+        "INSERT INTO transactions (phone_number, transaction_type, amount, timestamp, description) VALUES (?, ?, ?, ?, ?)",
+        (phone_number, transaction_type, amount, datetime.now(), description),
+    )
+    c.execute("SELECT wallet_balance FROM users WHERE phone_number = ?", (phone_number,))
+    return c.fetchone()[0]
+
+
+def adjust_balance(phone_number, amount, transaction_type, description, after=None, db_path="users.db"):
+    """Add amount (negative to withdraw) to a wallet and record the transaction.
+
+    Returns (new_balance, result) where result is the return value of the
+    optional after(conn, new_balance) hook, which runs in the same
+    transaction (e.g. to write the reply to the outbox).
+    """
+    if not math.isfinite(amount):
+        raise BalanceError("Amount must be a finite number")
+
+    def work(conn):
+        balance = _apply_change(conn.cursor(), phone_number, amount, transaction_type, description)
+        return balance, after(conn, balance) if after else None
+
+    return run_immediate(work, db_path)
+
+
+def transfer_balance(sender, recipient, amount, description, after=None, db_path="users.db"):
+    """Move amount from sender to recipient atomically.
+
+    Returns (sender_balance, result) like adjust_balance.
+    """
+    if not math.isfinite(amount) or amount <= 0:
+        raise BalanceError("Transfer amount must be greater than 0")
+    if sender == recipient:
+        raise BalanceError("Cannot transfer to the same wallet")
+
+    def work(conn):
+        c = conn.cursor()
+        balance = _apply_change(c, sender, -amount, "Transfer Out", description)
+        _apply_change(c, recipient, amount, "Transfer In", description)
+        return balance, after(conn, balance) if after else None
+
+    return run_immediate(work, db_path)